@@ -0,0 +1,231 @@
+import re, socket, threading, time, select
+
+from VideoStream import VideoStream
+from LiveVideoStream import LiveVideoStream, LIVE_PREFIX
+from RtpPacketizer import RtpPacketizer
+from RtpFec import FecEncoder
+from RtcpNack import RtcpNack
+from PacketHistory import PacketHistory, RateLimiter
+from LatencyTracer import LatencyTracer, nowUs
+
+class BroadcastChannel:
+	"""Shared "live channel" for one video file.
+
+	A single producer thread walks the stream on a shared clock, packetizes
+	each frame once and fans the same packets out to every subscribed session
+	(or sends them once to a multicast group). All subscribers see one RTP
+	stream, so sequence numbers and SSRC never need to be rewritten."""
+
+	FRAME_INTERVAL = 1.0 / 30.0  # Shared channel clock: 30 FPS
+	SSRC = 0x12345679
+
+	# Optional multicast delivery: (group, base_port). Each file gets its own
+	# port (base_port, base_port + 2, ...) so different files never mix, and
+	# keeps it when its channel restarts so joined clients keep receiving.
+	MULTICAST_ADDR = None
+	MULTICAST_TTL = 1
+	
+	# Forward error correction for fragmented frames: (L, D) parity matrix or None
+	FEC_MATRIX = None
+	
+	# NACK-based retransmission from one shared history; budget is per viewer
+	RETRANSMIT = False
+	RETRANSMIT_RATE = 1000
+	RETRANSMIT_BURST = 200
+
+	# Per-stage latency tracing; packets carry the same trace extension as sessions.
+	# TRACE_FILE is a path prefix for one per-frame CSV trace per channel.
+	TRACE = False
+	TRACE_FILE = None
+	TRACE_COLUMNS = ('frame', 'send_start_us', 'read_us', 'packetize_us', 'send_us', 'pacing_lag_us', 'packets')
+
+	# Registry of running channels, keyed by filename
+	channels = {}
+	channelsLock = threading.Lock()
+	multicastPorts = {}  # filename -> multicast port, assigned once
+
+	def __init__(self, filename):
+		self.filename = filename
+		if filename.startswith(LIVE_PREFIX):
+			self.videoStream = LiveVideoStream(filename[len(LIVE_PREFIX):])
+		else:
+			self.videoStream = VideoStream(filename)
+		self.subscribers = {}  # session id -> (address, port)
+		self.subscribersLock = threading.Lock()
+		self.activeEvent = threading.Event()  # Set while at least one subscriber is attached
+		self.finished = False
+		self.multicastAddr = None
+		self.fecEncoder = FecEncoder(*self.FEC_MATRIX) if self.FEC_MATRIX else None
+		self.history = PacketHistory(self.SSRC) if self.RETRANSMIT else None
+		self.retransmitLimiters = {}  # session id -> RateLimiter
+		self.tracer = LatencyTracer(f"channel {filename}") if self.TRACE else None
+		if self.tracer and self.TRACE_FILE:
+			traceName = re.sub(r'[^\w.-]', '_', filename)  # e.g. "live:/tmp/cam" -> "live__tmp_cam"
+			self.tracer.openTrace(f"{self.TRACE_FILE}-channel-{traceName}.csv", self.TRACE_COLUMNS)
+
+		self.rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		try:
+			self.rtpSocket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 8*1024*1024)
+		except:
+			pass
+		if self.MULTICAST_ADDR:
+			group, basePort = self.MULTICAST_ADDR
+			ports = BroadcastChannel.multicastPorts
+			if filename not in ports:
+				ports[filename] = int(basePort) + 2 * len(ports)
+			self.multicastAddr = (group, ports[filename])
+			try:
+				self.rtpSocket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.MULTICAST_TTL)
+			except:
+				pass
+		self.rtpSocket.setblocking(False)
+
+		self.stats = {
+			'retransmitted_packets': 0,
+			'start_time': time.time(),
+			'last_stats_time': time.time()
+		}
+
+		self.packetizer = RtpPacketizer(self.SSRC, self.stats, self.fecEncoder, self.history, self.tracer)
+
+		self.worker = threading.Thread(target=self.run)
+		self.worker.daemon = True
+		self.worker.start()
+		if self.history:
+			threading.Thread(target=self.recvRtcp, daemon=True).start()
+
+	@staticmethod
+	def getChannel(filename):
+		"""Return the running channel for filename, creating it if needed.
+		Raises IOError if the file cannot be opened."""
+		with BroadcastChannel.channelsLock:
+			channel = BroadcastChannel.channels.get(filename)
+			if channel is None or channel.finished:
+				channel = BroadcastChannel(filename)
+				BroadcastChannel.channels[filename] = channel
+			return channel
+
+	def subscribe(self, session, address):
+		"""Attach a session at the live edge. Returns False if the channel already ended."""
+		with self.subscribersLock:
+			if self.finished:
+				return False
+			self.subscribers[session] = address
+			if self.history:
+				self.retransmitLimiters[session] = RateLimiter(self.RETRANSMIT_RATE, self.RETRANSMIT_BURST)
+			self.activeEvent.set()
+		print(f"Channel {self.filename}: session {session} joined ({len(self.subscribers)} viewers)")
+		return True
+
+	def unsubscribe(self, session):
+		with self.subscribersLock:
+			address = self.subscribers.pop(session, None)
+			if address is None:
+				return
+			self.retransmitLimiters.pop(session, None)
+			if not self.subscribers:
+				self.activeEvent.clear()
+		print(f"Channel {self.filename}: session {session} left ({len(self.subscribers)} viewers)")
+
+	def run(self):
+		"""Producer loop: one frame read and packetization per tick, shared by all viewers."""
+		next_frame_time = time.time()
+		packetizer = self.packetizer
+		tracer = self.tracer
+
+		while True:
+			if not self.activeEvent.is_set():
+				# Nobody is watching: hold the channel clock instead of burning frames
+				self.activeEvent.wait()
+				next_frame_time = time.time()
+
+			current_time = time.time()
+			wait_time = next_frame_time - current_time
+			if wait_time > 0.001:
+				time.sleep(wait_time)
+			scheduled_time = next_frame_time
+			next_frame_time = max(current_time, next_frame_time) + self.FRAME_INTERVAL
+
+			frame_start_time = time.time()
+			if tracer:
+				read_start = nowUs()
+			data = self.videoStream.nextFrame()
+			if not data:
+				if self.videoStream.isEnded():
+					break
+				continue  # Live source has no new frame yet
+
+			if self.multicastAddr:
+				targets = [self.multicastAddr]
+			else:
+				with self.subscribersLock:
+					targets = list(self.subscribers.values())
+
+			if tracer:
+				send_start = nowUs()
+			frameNumber = self.videoStream.frameNbr()
+			packetizer.frameTimestamp = int(frame_start_time * 90000)
+			packets_sent = packetizer.sendFrame(self.rtpSocket, data, frameNumber, targets)
+			if tracer:
+				send_us = nowUs() - send_start - packetizer.packetizeUs
+				read_us = send_start - read_start
+				lag_us = int((frame_start_time - scheduled_time) * 1000000)
+				tracer.record('read', read_us)
+				tracer.record('packetize', packetizer.packetizeUs)
+				tracer.record('send', send_us)
+				tracer.record('pacing_lag', lag_us)
+				tracer.trace(frameNumber, send_start, read_us, packetizer.packetizeUs, send_us, lag_us, packets_sent)
+
+			if current_time - self.stats['last_stats_time'] >= 5.0:
+				self._printStatistics()
+				self.stats['last_stats_time'] = current_time
+
+		with self.subscribersLock:
+			self.finished = True
+			self.subscribers.clear()
+		with BroadcastChannel.channelsLock:
+			if BroadcastChannel.channels.get(self.filename) is self:
+				del BroadcastChannel.channels[self.filename]
+		self.rtpSocket.close()
+		print(f"Channel {self.filename}: end of stream")
+		if tracer:
+			print(tracer.summary())
+			tracer.close()
+
+	def recvRtcp(self):
+		"""Retransmit packets NACKed by any viewer, to that viewer only, or to the
+		group when the channel is multicast: viewers on one host share the group
+		port, so the NACK source cannot tell them apart. NACKs from addresses
+		that are not subscribed are ignored."""
+		while not self.finished:
+			try:
+				readable, _, _ = select.select([self.rtpSocket], [], [], 0.5)
+				if not readable:
+					continue
+				data, address = self.rtpSocket.recvfrom(2048)
+			except BlockingIOError:
+				continue
+			except (OSError, ValueError):
+				break
+
+			nack = RtcpNack()
+			if not nack.decode(data):
+				continue
+			with self.subscribersLock:
+				session = next((s for s, a in self.subscribers.items() if a == address), None)
+				limiter = self.retransmitLimiters.get(session)
+				target = self.multicastAddr or self.subscribers.get(session)
+			if limiter is None:
+				continue  # Not a viewer of this channel
+			now = time.time()
+			for seqnum in nack.lostSeqs():
+				packet = self.history.get(seqnum, now)
+				if packet is not None and limiter.allow(now):
+					if self.packetizer.send(self.rtpSocket, packet, target):
+						self.stats['retransmitted_packets'] += 1
+
+	def _printStatistics(self):
+		extraLines = [f"Viewers: {len(self.subscribers)}"]
+		if self.history:
+			extraLines.append(f"Retransmitted Packets: {self.stats['retransmitted_packets']}")
+		self.packetizer.printStatistics(f"Channel {self.filename}", extraLines)
@@ -1,10 +1,14 @@
 from tkinter import *
 import tkinter.messagebox
 from PIL import Image, ImageTk
-import socket, threading, sys, traceback, os, io, time, gc
+import socket, threading, sys, traceback, os, io, time, gc, struct
 import queue 
 
 from RtpPacket import RtpPacket
+from FrameAssembler import FrameAssembler
+from RtpFec import FEC_PT
+from RtcpNack import RtcpNack
+from LatencyTracer import LatencyTracer, parseTraceExtension, nowUs
 
 CACHE_FILE_NAME = "cache-"
 CACHE_FILE_EXT = ".jpg"
@@ -27,6 +31,14 @@ class Client:
 	# Tăng ngưỡng buffer lên để Caching hiệu quả hơn với video 4K
 	BUFFER_THRESHOLD = 40 
 	
+	# Gửi NACK (RTCP feedback) để server gửi lại các gói bị mất (bật bằng --nack)
+	NACK_ENABLED = False
+	
+	# Đo độ trễ từng giai đoạn (histogram); TRACE_FILE là tiền tố file CSV theo từng frame
+	TRACE = False
+	TRACE_FILE = None
+	TRACE_COLUMNS = ('frame', 'send_us', 'first_recv_us', 'last_recv_us', 'complete_us', 'dequeue_us', 'decoded_us', 'displayed_us')
+	
 	def __init__(self, master, serveraddr, serverport, rtpport, filename):
 		self.master = master
 		self.master.protocol("WM_DELETE_WINDOW", self.handler)
@@ -41,12 +53,17 @@ class Client:
 		self.teardownAcked = 0
 		
 		self.frameNbr = 0
-		self.currentFrameData = bytearray()
+		self.assembler = FrameAssembler() # Ghép frame theo số thứ tự gói + khôi phục FEC
 		self.frameBuffer = queue.Queue()
 		self.totalFrames = 0
 		self.stopEvent = threading.Event() 
 		self.isBuffering = False
 		self.downloadComplete = False
+		self.multicastAddr = None # (group, port) nếu server phát multicast
+		self.serverRtpAddr = None # Địa chỉ nguồn gói RTP, nơi nhận NACK
+		self.mediaSsrc = 0
+		self.tracer = LatencyTracer('client') if self.TRACE else None
+		self.clockOffset = None # Độ lệch nhỏ nhất (recv - send) giữa đồng hồ client và server
 		self.connectToServer()
 
 	def createWidgets(self):
@@ -83,6 +100,7 @@ class Client:
 			self.sendRtspRequest(self.SETUP)
 	
 	def exitClient(self):
+		self.printStatistics()
 		self.sendRtspRequest(self.TEARDOWN)
 		self.stopEvent.set()
 		try: 
@@ -135,23 +153,25 @@ class Client:
 		while not self.stopEvent.is_set():
 			try:
 				# Tăng kích thước nhận gói tin UDP để tránh bị drop packet với 4K
-				data = self.rtpSocket.recv(65535)
+				data, addr = self.rtpSocket.recvfrom(65535)
 				if data:
 					rtpPacket = RtpPacket()
 					rtpPacket.decode(data)
+					self.serverRtpAddr = addr
+					if self.tracer:
+						self.traceNetwork(rtpPacket)
 					
-					self.currentFrameData.extend(rtpPacket.getPayload())
-					
-					if rtpPacket.getMarker():
-						# Marker bit = 1 nghĩa là kết thúc 1 frame ảnh
-						if len(self.currentFrameData) > 0:
-							# Kiểm tra header/footer JPEG cơ bản
-							if self.currentFrameData.startswith(b'\xff\xd8') and self.currentFrameData.endswith(b'\xff\xd9'):
-								# Đưa frame hoàn chỉnh vào buffer
-								self.frameBuffer.put(bytes(self.currentFrameData))
-						
-						self.currentFrameData = bytearray()
+					# Assembler trả về các frame đã đủ gói (kể cả gói khôi phục bằng FEC)
+					for frame, info in self.assembler.addPacket(rtpPacket):
+						self.frameBuffer.put((frame, self.traceFrame(info) if self.tracer else None))
+					if rtpPacket.payloadType() != FEC_PT:
+						self.mediaSsrc = rtpPacket.ssrc()
+					self.sendNacks()
 			except socket.timeout:
+				# Bỏ các frame thiếu gói đã quá hạn chờ
+				for frame, info in self.assembler.poll():
+					self.frameBuffer.put((frame, self.traceFrame(info) if self.tracer else None))
+				self.sendNacks()
 				if (self.state == self.PLAYING):
 					self.downloadComplete = True
 				continue
@@ -196,8 +216,11 @@ class Client:
 
 			# --- HIỂN THỊ ẢNH ---
 			try:
-				frameData = self.frameBuffer.get_nowait()
-				self.updateMovie(frameData)
+				frameData, trace = self.frameBuffer.get_nowait()
+				if trace:
+					trace.append(nowUs())
+					self.tracer.record('buffer', trace[5] - trace[4])
+				self.updateMovie(frameData, trace)
 			except queue.Empty:
 				pass
 
@@ -214,7 +237,53 @@ class Client:
 				# Nếu xử lý quá lâu (lâu hơn cả 1 frame), không ngủ nữa để đuổi kịp tiến độ
 				pass
 
-	def updateMovie(self, imageBytes):
+	def sendNacks(self):
+		"""Gửi generic NACK cho các gói đang thiếu (nếu đến hạn)."""
+		if not self.NACK_ENABLED or self.serverRtpAddr is None:
+			return
+		seqs = self.assembler.pendingNacks()
+		if seqs:
+			nack = RtcpNack()
+			nack.encode(self.sessionId & 0xFFFFFFFF, self.mediaSsrc, seqs)
+			try:
+				self.rtpSocket.sendto(nack.getPacket(), self.serverRtpAddr)
+			except: pass
+
+	def printStatistics(self):
+		"""In thống kê ghép frame / FEC phía client."""
+		stats = self.assembler.stats
+		print(f"\n=== Client Statistics ===")
+		print(f"Frames Completed: {stats['frames_completed']}")
+		print(f"Frames Dropped: {stats['frames_dropped']}")
+		print(f"FEC Packets Received: {stats['fec_packets_received']}")
+		print(f"Packets Recovered (FEC): {stats['packets_recovered']}")
+		print(f"Packets Unrecoverable: {stats['packets_unrecovered']}")
+		print(f"Packets NACKed: {stats['packets_nacked']}")
+		print(f"=======================\n")
+		if self.tracer:
+			print(self.tracer.summary())
+			self.tracer.close()
+
+	def traceNetwork(self, rtpPacket):
+		"""Ghi độ trễ mạng của gói (so với độ lệch đồng hồ nhỏ nhất đã thấy)."""
+		ext = parseTraceExtension(rtpPacket.getExtension())
+		if ext:
+			offset = nowUs() - ext[0]
+			if self.clockOffset is None or offset < self.clockOffset:
+				self.clockOffset = offset
+			self.tracer.record('network', offset - self.clockOffset)
+
+	def traceFrame(self, info):
+		"""Bắt đầu bản ghi trace của một frame vừa ghép xong."""
+		firstArrival, lastArrival, ext = info
+		ext = parseTraceExtension(ext)
+		frameId, sendUs = (ext[1], ext[0]) if ext else (-1, 0)
+		trace = [frameId, sendUs, int(firstArrival * 1000000), int(lastArrival * 1000000), nowUs()]
+		self.tracer.record('receive', trace[3] - trace[2])
+		self.tracer.record('reassembly', trace[4] - trace[3])
+		return trace
+
+	def updateMovie(self, imageBytes, trace=None):
 		try:
 			# Sử dụng io.BytesIO để đọc ảnh từ RAM (nhanh hơn ghi ra đĩa)
 			img = Image.open(io.BytesIO(imageBytes))
@@ -228,16 +297,26 @@ class Client:
 			img.thumbnail((w, h), Image.Resampling.LANCZOS)
 			
 			photo = ImageTk.PhotoImage(img)
+			if trace:
+				trace.append(nowUs())
+				self.tracer.record('decode', trace[6] - trace[5])
 			
 			# Cập nhật UI trên luồng chính (Main Thread)
-			self.master.after(0, lambda p=photo: self._update_label(p))
+			self.master.after(0, lambda p=photo, t=trace: self._update_label(p, t))
 		except Exception as e:
 			print(f"Frame error: {e}")
 			pass
 		
-	def _update_label(self, photo):
+	def _update_label(self, photo, trace=None):
 		self.label.configure(image=photo)
 		self.label.image = photo
+		if trace:
+			trace.append(nowUs())
+			self.tracer.record('display', trace[7] - trace[6])
+			if trace[1] and self.clockOffset is not None:
+				# Glass-to-glass: từ lúc server gửi gói đầu tiên đến khi ảnh lên màn hình
+				self.tracer.record('total', trace[7] - trace[1] - self.clockOffset)
+			self.tracer.trace(*trace)
 
 	def connectToServer(self):
 		self.rtspSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -312,6 +391,9 @@ class Client:
 					if int(lines[0].split(' ')[1]) == 200: 
 						if self.requestSent == self.SETUP:
 							self.state = self.READY 
+							self.parseTransport(lines[3:])
+							if self.tracer and self.TRACE_FILE:
+								self.tracer.openTrace(f"{self.TRACE_FILE}-client-{self.sessionId}.csv", self.TRACE_COLUMNS)
 							self.openRtpPort() 
 							if not hasattr(self, 'networkThread') or not self.networkThread.is_alive():
 								self.networkThread = threading.Thread(target=self.runNetworkLoop)
@@ -330,13 +412,36 @@ class Client:
 		except:
 			pass
 	
+	def parseTransport(self, lines):
+		"""Đọc dòng Transport (nếu có) để biết nhóm multicast của kênh broadcast."""
+		for line in lines:
+			if not line.startswith('Transport:') or 'multicast' not in line:
+				continue
+			params = {}
+			for field in line.split(';'):
+				if '=' in field:
+					key, value = field.split('=', 1)
+					params[key.strip()] = value.strip()
+			try:
+				self.multicastAddr = (params['destination'], int(params['port']))
+			except (KeyError, ValueError):
+				pass
+	
 	def openRtpPort(self):
 		self.rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 		self.rtpSocket.settimeout(0.5) 
 		try:
 			# Tăng bộ đệm nhận của Socket để chứa frame 4K lớn
 			self.rtpSocket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 10*1024*1024)
-			self.rtpSocket.bind(('', self.rtpPort))
+			if self.multicastAddr:
+				# Kênh multicast: bind vào cổng của nhóm và tham gia nhóm
+				group, port = self.multicastAddr
+				self.rtpSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+				self.rtpSocket.bind(('', port))
+				mreq = struct.pack('4s4s', socket.inet_aton(group), socket.inet_aton('0.0.0.0'))
+				self.rtpSocket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+			else:
+				self.rtpSocket.bind(('', self.rtpPort))
 		except:
 			tkinter.messagebox.showwarning('Unable to Bind', 'Unable to bind PORT=%d' %self.rtpPort)
 
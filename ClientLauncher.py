@@ -9,7 +9,21 @@ if __name__ == "__main__":
 		rtpPort = sys.argv[3]
 		fileName = sys.argv[4]	
 	except:
-		print("[Usage: ClientLauncher.py Server_name Server_port RTP_port Video_file]\n")	
+		print("[Usage: ClientLauncher.py Server_name Server_port RTP_port Video_file [--nack] [--trace] [--trace-file prefix]]\n")	
+	
+	# Optional NACK feedback for servers started with --nack
+	if '--nack' in sys.argv:
+		Client.NACK_ENABLED = True
+	
+	# Optional per-stage latency tracing
+	if '--trace' in sys.argv:
+		Client.TRACE = True
+	if '--trace-file' in sys.argv:
+		try:
+			Client.TRACE_FILE = sys.argv[sys.argv.index('--trace-file') + 1]
+			Client.TRACE = True
+		except IndexError:
+			print("[Usage: --trace-file prefix]\n")
 	
 	root = Tk()
 	
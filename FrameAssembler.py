@@ -0,0 +1,188 @@
+import time
+
+from RtpFec import FEC_PT, FecDecoder
+from RtcpNack import HOLD_TIME
+
+SOI = b'\xff\xd8'
+EOI = b'\xff\xd9'
+
+class FrameAssembler:
+	"""Rebuild JPEG frames from RTP fragments using sequence numbers.
+
+	Packets are grouped per frame by RTP timestamp. A frame is complete when
+	its marker packet is known, its first fragment starts with SOI and every
+	sequence number in between is present. FEC parity (if the server sends
+	it) is applied before the completeness check. Frames are released in
+	order; an incomplete frame is held for at most HOLD_TIME seconds. Each
+	released frame comes with (first arrival, last arrival, header extension
+	of its first packet) for latency tracing; times use time.monotonic().
+
+	Gaps in the media sequence are tracked so the client can NACK them; a
+	missing packet is asked for again every NACK_RETRY_INTERVAL until it
+	arrives, its frame is released/dropped, or the retries run out."""
+
+	HOLD_TIME = HOLD_TIME
+	NACK_DELAY = 0.01  # Grace period for reordering / FEC before the first NACK
+	NACK_RETRY_INTERVAL = 0.04
+	NACK_MAX_RETRIES = 3
+	MAX_GAP = 512  # Larger jumps are treated as a stream restart, not loss
+
+	def __init__(self):
+		self.frames = {}  # timestamp -> frame state
+		self.lastEndSeq = None  # Sequence number of the last released/dropped frame's marker
+		self.anchored = False  # lastEndSeq only guessed from the first packets so far
+		self.highestSeq = None  # Highest media sequence number seen
+		self.missing = {}  # seq -> [next NACK time, retries left]
+		self.stats = {
+			'frames_completed': 0,
+			'frames_dropped': 0,
+			'fec_packets_received': 0,
+			'packets_recovered': 0,
+			'packets_unrecovered': 0,
+			'packets_nacked': 0
+		}
+
+	def addPacket(self, rtpPacket):
+		"""Feed one decoded RTP packet. Returns a list of (frame, info) ready to display."""
+		now = time.monotonic()
+		timestamp = rtpPacket.timestamp()
+
+		if rtpPacket.payloadType() == FEC_PT:
+			parity = FecDecoder.parseParity(rtpPacket.getPayload())
+			if parity is None:
+				return []
+			self.stats['fec_packets_received'] += 1
+			self._setBase(parity[0])
+			if self._isLate(parity[0]):
+				return []  # Frame already released, parity not needed
+			frame = self._getFrame(timestamp, now)
+			frame['parity'].append(parity)
+			self._noteSeq(frame, parity[0])
+		else:
+			seqnum = rtpPacket.seqNum()
+			self._setBase(seqnum)
+			if self._isLate(seqnum):
+				return []
+			frame = self._getFrame(timestamp, now)
+			marker = rtpPacket.getMarker()
+			frame['packets'][seqnum] = (rtpPacket.getPayload(), marker)
+			frame['lastArrival'] = now
+			if frame['ext'] is None:
+				frame['ext'] = rtpPacket.getExtension()
+			self._noteSeq(frame, seqnum)
+			self._trackGap(seqnum, now)
+			if marker:
+				frame['endSeq'] = seqnum
+
+		if frame['parity']:
+			recovered = FecDecoder.recover(frame['packets'], frame['parity'])
+			if recovered:
+				self.stats['packets_recovered'] += recovered
+				for seqnum, (payload, marker) in frame['packets'].items():
+					if marker:
+						frame['endSeq'] = seqnum
+					self._noteSeq(frame, seqnum)
+					self.missing.pop(seqnum, None)
+
+		return self.poll(now)
+
+	def poll(self, now=None):
+		"""Release complete frames in order and drop stale incomplete ones."""
+		if now is None:
+			now = time.monotonic()
+		ready = []
+		while self.frames:
+			timestamp = min(self.frames, key=lambda ts: self._seqKey(self.frames[ts]['firstSeq']))
+			frame = self.frames[timestamp]
+			data = self._assemble(frame)
+			if data is not None:
+				ready.append((data, (frame['arrival'], frame['lastArrival'], frame['ext'])))
+				self.stats['frames_completed'] += 1
+			elif now - frame['arrival'] >= self.HOLD_TIME:
+				self.stats['frames_dropped'] += 1
+				self.stats['packets_unrecovered'] += self._countMissing(frame)
+			else:
+				break
+			del self.frames[timestamp]
+			if frame['endSeq'] is not None:
+				self.lastEndSeq = frame['endSeq']
+				self.anchored = False
+		return ready
+
+	def pendingNacks(self, now=None):
+		"""Sequence numbers that should be NACKed now."""
+		if not self.missing:
+			return []
+		if now is None:
+			now = time.monotonic()
+		seqs = []
+		for seqnum, state in list(self.missing.items()):
+			if state[1] <= 0 or self._isLate(seqnum):
+				del self.missing[seqnum]  # Gave up, or its frame is already gone
+			elif now >= state[0]:
+				seqs.append(seqnum)
+				state[0] = now + self.NACK_RETRY_INTERVAL
+				state[1] -= 1
+		self.stats['packets_nacked'] += len(seqs)
+		return seqs
+
+	def _trackGap(self, seqnum, now):
+		self.missing.pop(seqnum, None)
+		if self.highestSeq is None:
+			self.highestSeq = seqnum
+			return
+		gap = (seqnum - self.highestSeq) % 65536
+		if gap == 0 or gap >= 32768:
+			return  # Duplicate, reordered or retransmitted packet
+		if gap <= self.MAX_GAP:
+			for i in range(1, gap):
+				self.missing[(self.highestSeq + i) % 65536] = [now + self.NACK_DELAY, self.NACK_MAX_RETRIES]
+		self.highestSeq = seqnum
+
+	def _getFrame(self, timestamp, now):
+		frame = self.frames.get(timestamp)
+		if frame is None:
+			frame = {'packets': {}, 'parity': [], 'endSeq': None, 'firstSeq': None, 'arrival': now, 'lastArrival': now, 'ext': None}
+			self.frames[timestamp] = frame
+		return frame
+
+	def _setBase(self, seqnum):
+		"""Anchor sequence ordering on the earliest packet seen before the first
+		frame is released, so a first frame that wraps past 65535 still sorts
+		and assembles in order."""
+		if self.lastEndSeq is None or (self.anchored and self._seqKey(seqnum) >= 65536 - self.MAX_GAP):
+			self.lastEndSeq = (seqnum - 1) % 65536
+			self.anchored = True
+
+	def _seqKey(self, seqnum):
+		"""Position of seqnum relative to the next expected sequence number."""
+		return (seqnum - self.lastEndSeq - 1) % 65536
+
+	def _isLate(self, seqnum):
+		return self._seqKey(seqnum) >= 32768
+
+	def _noteSeq(self, frame, seqnum):
+		if frame['firstSeq'] is None or self._seqKey(seqnum) < self._seqKey(frame['firstSeq']):
+			frame['firstSeq'] = seqnum
+
+	def _assemble(self, frame):
+		endSeq = frame['endSeq']
+		packets = frame['packets']
+		if endSeq is None or frame['firstSeq'] not in packets:
+			return None
+		count = (endSeq - frame['firstSeq']) % 65536 + 1
+		if len(packets) < count:
+			return None
+		seqs = [(frame['firstSeq'] + i) % 65536 for i in range(count)]
+		if any(s not in packets for s in seqs):
+			return None
+		data = b''.join(packets[s][0] for s in seqs)
+		if not (data.startswith(SOI) and data.endswith(EOI)):
+			return None
+		return data
+
+	def _countMissing(self, frame):
+		if frame['endSeq'] is None or frame['firstSeq'] is None:
+			return 1
+		count = (frame['endSeq'] - frame['firstSeq']) % 65536 + 1
+		return max(1, count - len(frame['packets']))
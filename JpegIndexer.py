@@ -0,0 +1,183 @@
+import mmap, multiprocessing, os, re, threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+SOI = b'\xff\xd8' # Start of Image
+
+# parseFrame() results other than a frame end offset
+INVALID = -1
+TRUNCATED = -2
+
+# Inside entropy-coded data 0xFF is always followed by a stuffed 0x00, a
+# restart marker (D0-D7) or a fill byte, so the first other FF xx is the next
+# real marker. Searching with a regex keeps that scan in C.
+ECS_MARKER = re.compile(rb'\xff[^\x00\xd0-\xd7\xff]')
+
+PARALLEL_THRESHOLD = 256 * 1024 * 1024  # Smaller files are indexed in-process
+MIN_CHUNK_SIZE = 32 * 1024 * 1024
+
+# Indexes of recently opened files, so every session playing the same file
+# does not walk it again. Keyed by path and file identity, so a replaced or
+# modified file is indexed afresh.
+INDEX_CACHE_SIZE = 16
+_indexCache = {}
+_indexCacheLock = threading.Lock()
+
+def parseFrame(data, pos=0, state=None):
+	"""Walk the JPEG marker segments of the frame whose SOI is at pos.
+
+	Segment length fields are honoured, so an EXIF thumbnail (with its own
+	FF D8 ... FF D9) inside APP1 is skipped as a whole, and entropy-coded
+	data after SOS is skipped up to the next real marker.
+
+	Returns (end, state): end is the offset just past EOI, INVALID, or
+	TRUNCATED if data ends first; in that case pass state back in once more
+	data has been appended to resume where the walk stopped. For INVALID,
+	state is the offset where the walk failed: everything before it was
+	walked as segments of this frame, so a new search starts there."""
+	n = len(data)
+	if state is None:
+		if data[pos:pos + 2] != SOI:
+			return INVALID, pos
+		p, inScan = pos + 2, False
+	else:
+		p, inScan = state
+
+	while True:
+		if inScan:
+			m = ECS_MARKER.search(data, p)
+			if m is None:
+				# Resume one byte back: a trailing 0xFF may start the next marker
+				return TRUNCATED, (max(p, n - 1), True)
+			p = m.start()
+			inScan = False
+
+		if p + 2 > n:
+			return TRUNCATED, (p, False)
+		if data[p] != 0xFF:
+			return INVALID, p
+		marker = data[p + 1]
+		if marker == 0xFF:
+			p += 1  # Fill byte
+			continue
+		if marker == 0xD9:
+			return p + 2, None
+		if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+			p += 2  # Standalone markers have no length field
+			continue
+		if marker == 0xD8 or marker == 0x00:
+			return INVALID, p
+
+		if p + 4 > n:
+			return TRUNCATED, (p, False)
+		length = data[p + 2] << 8 | data[p + 3]
+		if length < 2:
+			return INVALID, p
+		p += 2 + length
+		if marker == 0xDA:
+			inScan = True  # SOS: entropy-coded data follows the header
+
+def scanRange(data, start, limit):
+	"""Index complete frames whose SOI lies in [start, limit).
+	Frames may extend past limit. Returns a flat array of (start, end) pairs."""
+	frames = array('Q')
+	pos = start
+	while True:
+		s = data.find(SOI, pos, limit + 1)
+		if s < 0:
+			break
+		end, state = parseFrame(data, s)
+		if end == TRUNCATED:
+			break  # Runs into the end of the file
+		if end == INVALID:
+			# Not a frame: resume where the walk failed, not inside segments it
+			# already skipped (an EXIF thumbnail would look like a frame)
+			pos = state
+			continue
+		frames.append(s)
+		frames.append(end)
+		pos = end
+	return frames
+
+def _scanChunk(args):
+	"""Worker process entry point: index one chunk of the file."""
+	filename, start, limit = args
+	with open(filename, 'rb') as f:
+		data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	try:
+		return scanRange(data, start, limit).tobytes()
+	finally:
+		data.close()
+
+def indexFrames(data, filename=None):
+	"""Build the compact playback index: (offsets, lengths) arrays.
+
+	Large files are split into chunks scanned by worker processes. A worker
+	starting mid-file may lock onto a bogus SOI (e.g. an embedded thumbnail)
+	so chunk results are reconciled in order: frames overlapping the
+	previous frame are dropped and any gap is rescanned sequentially.
+	Workers are spawned rather than forked, since the server is multithreaded.
+
+	With a filename the result is cached; callers must not modify it."""
+	if filename is None:
+		return _toIndex(scanRange(data, 0, len(data)))
+	try:
+		st = os.stat(filename)
+		key = (os.path.realpath(filename), st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+	except OSError:
+		key = None
+	with _indexCacheLock:
+		index = _indexCache.get(key)
+	if index is None:
+		index = _indexFile(data, filename)
+		if key is not None:
+			with _indexCacheLock:
+				_indexCache[key] = index
+				while len(_indexCache) > INDEX_CACHE_SIZE:
+					del _indexCache[next(iter(_indexCache))]  # Oldest first
+	return index
+
+def _indexFile(data, filename):
+	size = len(data)
+	workers = os.cpu_count() or 1
+	if size < PARALLEL_THRESHOLD or workers < 2:
+		return _toIndex(scanRange(data, 0, size))
+
+	chunkCount = max(2, min(workers * 4, size // MIN_CHUNK_SIZE))
+	chunkSize = -(-size // chunkCount)
+	bounds = [(filename, s, min(s + chunkSize, size)) for s in range(0, size, chunkSize)]
+	try:
+		with ProcessPoolExecutor(max_workers=min(workers, len(bounds)), mp_context=multiprocessing.get_context('spawn')) as pool:
+			results = list(pool.map(_scanChunk, bounds))
+	except Exception as e:
+		print(f"JpegIndexer: parallel indexing failed ({e}), falling back to a single process")
+		return _toIndex(scanRange(data, 0, size))
+
+	merged = array('Q')
+	pos = 0
+	for result in results:
+		frames = array('Q')
+		frames.frombytes(result)
+		for i in range(0, len(frames), 2):
+			s, e = frames[i], frames[i + 1]
+			if s < pos:
+				continue  # Inside a frame already indexed
+			if s > pos:
+				# Make sure the worker did not skip a frame starting in the gap
+				gap = scanRange(data, pos, s)
+				if len(gap):
+					merged.extend(gap)
+					pos = gap[-1]
+					if s < pos:
+						continue
+			merged.append(s)
+			merged.append(e)
+			pos = e
+	if pos < size:
+		merged.extend(scanRange(data, pos, size))
+	return _toIndex(merged)
+
+def _toIndex(frames):
+	offsets = array('Q', frames[0::2])
+	lengths = array('Q', (frames[i + 1] - frames[i] for i in range(0, len(frames), 2)))
+	return offsets, lengths
@@ -0,0 +1,88 @@
+import struct, threading, time
+
+# RTP header extension carrying the sender's monotonic send time (microseconds)
+# and the frame id, so the receiver can attribute delay to the network.
+TRACE_EXT_PROFILE = 0x5452  # 'TR'
+TRACE_EXT_FORMAT = '>QI'
+TRACE_EXT_SIZE = 4 + 12  # Extension header + data (3 words)
+
+def nowUs():
+	"""Monotonic clock in microseconds, the time base of every trace."""
+	return time.monotonic_ns() // 1000
+
+def makeTraceExtension(frameId):
+	return struct.pack(TRACE_EXT_FORMAT, nowUs(), frameId & 0xFFFFFFFF)
+
+def parseTraceExtension(extension):
+	"""Return (sendUs, frameId) from RtpPacket.getExtension(), or None."""
+	if extension is None or extension[0] != TRACE_EXT_PROFILE or len(extension[1]) < 12:
+		return None
+	return struct.unpack(TRACE_EXT_FORMAT, bytes(extension[1][:12]))
+
+class LatencyTracer:
+	"""Per-stage latency histograms plus an optional per-frame trace file.
+
+	Durations are recorded in microseconds into power-of-two buckets, so a
+	probe costs one dict lookup and a few integer operations. Callers keep a
+	None tracer when tracing is off and guard probes with `if tracer:`."""
+
+	BUCKETS = 32  # Up to ~35 minutes in microseconds
+
+	def __init__(self, name):
+		self.name = name
+		self.histograms = {}  # stage -> [count, total, max, buckets]
+		self.lock = threading.Lock()
+		self.traceFile = None
+
+	def openTrace(self, path, columns):
+		"""Start dumping one CSV row per frame to path."""
+		with self.lock:
+			self.traceFile = open(path, 'w')
+			self.traceFile.write(','.join(columns) + '\n')
+
+	def record(self, stage, durationUs):
+		durationUs = max(0, int(durationUs))
+		with self.lock:
+			hist = self.histograms.get(stage)
+			if hist is None:
+				hist = self.histograms[stage] = [0, 0, 0, [0] * self.BUCKETS]
+			hist[0] += 1
+			hist[1] += durationUs
+			if durationUs > hist[2]:
+				hist[2] = durationUs
+			hist[3][min(durationUs.bit_length(), self.BUCKETS - 1)] += 1
+
+	def trace(self, *values):
+		"""Append one row to the per-frame trace file (no-op without a file)."""
+		if self.traceFile:
+			with self.lock:
+				if self.traceFile:
+					self.traceFile.write(','.join(str(v) for v in values) + '\n')
+
+	def percentile(self, stage, fraction):
+		"""Upper bound of the bucket holding the given fraction of samples, in microseconds."""
+		hist = self.histograms.get(stage)
+		if not hist or not hist[0]:
+			return 0
+		target = hist[0] * fraction
+		seen = 0
+		for bucket, count in enumerate(hist[3]):
+			seen += count
+			if seen >= target:
+				return min((1 << bucket) - 1, hist[2])
+		return hist[2]
+
+	def summary(self):
+		lines = [f"=== Latency ({self.name}, ms) ==="]
+		lines.append(f"{'stage':<12}{'count':>8}{'avg':>9}{'p50':>9}{'p99':>9}{'max':>9}")
+		for stage, hist in self.histograms.items():
+			count, total, maxUs = hist[0], hist[1], hist[2]
+			lines.append(f"{stage:<12}{count:>8}{total / count / 1000:>9.2f}"
+				f"{self.percentile(stage, 0.5) / 1000:>9.2f}{self.percentile(stage, 0.99) / 1000:>9.2f}{maxUs / 1000:>9.2f}")
+		return '\n'.join(lines)
+
+	def close(self):
+		if self.traceFile:
+			with self.lock:
+				self.traceFile.close()
+				self.traceFile = None
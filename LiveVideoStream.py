@@ -0,0 +1,161 @@
+import os, stat, sys, threading, time
+
+from JpegIndexer import parseFrame, SOI, INVALID, TRUNCATED
+
+# SETUP filenames with this prefix are served from a live source, e.g.
+# "live:/tmp/camera.fifo", "live:growing.Mjpeg" or "live:-" for stdin.
+LIVE_PREFIX = 'live:'
+
+class LiveSource:
+	"""Reads an MJPEG byte stream (file, FIFO or stdin) in bounded chunks.
+
+	Frames are delimited by walking JPEG marker segments incrementally: the
+	walk resumes where the previous chunk ended, so a frame is published as
+	soon as its EOI arrives even if it straddles chunk edges, and no byte is
+	scanned twice. Only the last RING_SIZE frames are kept; memory stays
+	bounded however long the stream runs. One source is shared by every
+	session watching the same path."""
+
+	CHUNK_SIZE = 64 * 1024
+	RING_SIZE = 60  # Frames kept for sessions that fall slightly behind
+	MAX_FRAME_SIZE = 16 * 1024 * 1024  # Discard runaway data with no EOI
+	POLL_INTERVAL = 0.01  # Regular files: wait for the writer to append more
+	IDLE_TIMEOUT = 5.0  # Regular files: treat the stream as ended after this long without growth
+
+	sources = {}
+	sourcesLock = threading.Lock()
+
+	def __init__(self, path):
+		self.path = path
+		if path != '-' and not os.path.exists(path):
+			raise IOError
+		self.ring = [None] * self.RING_SIZE
+		self.frameCount = 0  # Total frames published so far
+		self.ended = False
+		self.droppedBytes = 0
+		self.worker = threading.Thread(target=self.run)
+		self.worker.daemon = True
+		self.worker.start()
+
+	@staticmethod
+	def getSource(path):
+		"""Return the running source for path, starting a reader if needed."""
+		with LiveSource.sourcesLock:
+			source = LiveSource.sources.get(path)
+			if source is None or source.ended:
+				source = LiveSource(path)
+				LiveSource.sources[path] = source
+			return source
+
+	def frameAt(self, index):
+		"""Frame with absolute index, or None if not yet published or already evicted."""
+		if index < self.frameCount - self.RING_SIZE or index >= self.frameCount:
+			return None
+		return self.ring[index % self.RING_SIZE]
+
+	def run(self):
+		try:
+			# Opening a FIFO blocks until a writer shows up, so do it here
+			fd = sys.stdin.fileno() if self.path == '-' else os.open(self.path, os.O_RDONLY)
+		except OSError:
+			self._finish()
+			return
+		follow = stat.S_ISREG(os.fstat(fd).st_mode)
+
+		buf = bytearray()
+		inFrame = False  # buf starts with SOI
+		state = None  # parseFrame() resume point inside buf
+		lastData = time.time()
+
+		while True:
+			try:
+				chunk = os.read(fd, self.CHUNK_SIZE)
+			except OSError:
+				break
+			if not chunk:
+				if not follow or time.time() - lastData > self.IDLE_TIMEOUT:
+					break
+				# File still being written: wait for more data
+				time.sleep(self.POLL_INTERVAL)
+				continue
+			lastData = time.time()
+			buf += chunk
+
+			while True:
+				if not inFrame:
+					start = buf.find(SOI)
+					if start < 0:
+						# Keep a trailing 0xFF in case SOI straddles the chunk edge
+						self.droppedBytes += max(0, len(buf) - 1)
+						del buf[:-1]
+						break
+					self.droppedBytes += start
+					del buf[:start]
+					inFrame = True
+					state = None
+
+				end, state = parseFrame(buf, 0, state)
+				if end == TRUNCATED:
+					if len(buf) > self.MAX_FRAME_SIZE:
+						self.droppedBytes += len(buf)
+						buf.clear()
+						inFrame = False
+					break
+				if end == INVALID:
+					# Not a real frame: drop what was walked and look for the next SOI
+					# from where the walk failed, past any embedded thumbnail
+					self.droppedBytes += state
+					del buf[:state]
+					inFrame = False
+					continue
+
+				self._publish(bytes(buf[:end]))
+				del buf[:end]
+				inFrame = False
+
+		if self.path != '-':
+			os.close(fd)
+		self._finish()
+
+	def _publish(self, frame):
+		self.ring[self.frameCount % self.RING_SIZE] = frame
+		self.frameCount += 1
+
+	def _finish(self):
+		self.ended = True
+		with LiveSource.sourcesLock:
+			if LiveSource.sources.get(self.path) is self:
+				del LiveSource.sources[self.path]
+		print(f"LiveSource: {self.path} ended after {self.frameCount} frames")
+
+class LiveVideoStream:
+	"""Per-session cursor over a LiveSource with the VideoStream interface.
+
+	Sessions join at the live edge (the most recent complete frame) and
+	nextFrame() returns None while no new frame is available yet."""
+
+	def __init__(self, path):
+		self.filename = path
+		self.source = LiveSource.getSource(path)
+		self.frameNum = max(0, self.source.frameCount - 1)
+		print(f"LiveVideoStream: joined {path} at frame {self.frameNum}")
+
+	def nextFrame(self):
+		"""Get next frame, or None if the live edge has been reached."""
+		source = self.source
+		if self.frameNum >= source.frameCount:
+			return None
+		if self.frameNum < source.frameCount - source.RING_SIZE:
+			# Fell out of the ring: skip ahead to the live edge
+			self.frameNum = source.frameCount - 1
+		frame = source.frameAt(self.frameNum)
+		self.frameNum += 1
+		return frame
+
+	def frameNbr(self):
+		"""Get frame number."""
+		return self.frameNum
+
+	def isEnded(self):
+		"""True once the source has closed and every frame was delivered."""
+		return self.source.ended and self.frameNum >= self.source.frameCount
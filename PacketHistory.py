@@ -0,0 +1,56 @@
+import time
+
+from RtpPacket import RtpPacket
+from RtcpNack import HOLD_TIME, RETRANSMIT_RTT
+
+class PacketHistory:
+	"""Bounded ring of recently sent RTP packets, indexed by sequence number.
+
+	Entries keep a reference to the frame bytes plus the fragment bounds
+	instead of a copy of the packet, so the ring shares payload memory with
+	the VideoStream frame cache. Packets are rebuilt on demand when a NACK
+	asks for them, and only while their playout deadline has not passed."""
+
+	RING_SIZE = 4096  # Packets kept per session (~3 frames of 4K)
+	DEADLINE = HOLD_TIME - RETRANSMIT_RTT  # Seconds after the original send when a retransmit is still useful
+
+	def __init__(self, ssrc, payloadType=26):
+		self.ssrc = ssrc
+		self.payloadType = payloadType
+		self.ring = [None] * self.RING_SIZE
+
+	def add(self, seqnum, frame, start, end, marker, timestamp):
+		self.ring[seqnum % self.RING_SIZE] = (seqnum, frame, start, end, marker, timestamp, time.time())
+
+	def get(self, seqnum, now=None):
+		"""Rebuild the packet for seqnum, or None if it is gone or too late to help."""
+		entry = self.ring[seqnum % self.RING_SIZE]
+		if entry is None or entry[0] != seqnum:
+			return None
+		if now is None:
+			now = time.time()
+		if now - entry[6] > self.DEADLINE:
+			return None
+		frame, start, end, marker, timestamp = entry[1], entry[2], entry[3], entry[4], entry[5]
+		rtpPacket = RtpPacket()
+		rtpPacket.encode(2, 0, 0, 0, seqnum, marker, self.payloadType, self.ssrc, memoryview(frame)[start:end], timestamp)
+		return rtpPacket.getPacket()
+
+class RateLimiter:
+	"""Token bucket limiting retransmissions to `rate` packets per second."""
+
+	def __init__(self, rate, burst):
+		self.rate = float(rate)
+		self.burst = float(burst)
+		self.tokens = float(burst)
+		self.lastTime = time.time()
+
+	def allow(self, now=None):
+		if now is None:
+			now = time.time()
+		self.tokens = min(self.burst, self.tokens + (now - self.lastTime) * self.rate)
+		self.lastTime = now
+		if self.tokens >= 1.0:
+			self.tokens -= 1.0
+			return True
+		return False
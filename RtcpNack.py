@@ -0,0 +1,71 @@
+# Playout budget shared by both ends: the client holds an incomplete frame
+# for HOLD_TIME seconds, and the server stops retransmitting RETRANSMIT_RTT
+# earlier so a repair never arrives after its frame has been dropped.
+HOLD_TIME = 0.2
+RETRANSMIT_RTT = 0.05
+
+RTCP_RTPFB = 205  # Transport layer feedback (RFC 4585)
+NACK_FMT = 1  # Generic NACK
+HEADER_SIZE = 12
+
+class RtcpNack:
+	"""Generic NACK (RFC 4585 section 6.2.1): a list of (PID, BLP) pairs, each
+	naming one lost packet plus a bitmask of the 16 packets following it."""
+
+	def __init__(self):
+		self.senderSsrc = 0
+		self.mediaSsrc = 0
+		self.seqs = []
+
+	def encode(self, senderSsrc, mediaSsrc, seqs):
+		"""Encode the lost sequence numbers into an RTCP feedback packet."""
+		self.senderSsrc = senderSsrc
+		self.mediaSsrc = mediaSsrc
+		self.seqs = list(seqs)
+
+		fci = bytearray()
+		pending = sorted(set(self.seqs))
+		while pending:
+			pid = pending.pop(0)
+			blp = 0
+			for seq in list(pending):
+				diff = (seq - pid) % 65536
+				if 1 <= diff <= 16:
+					blp |= 1 << (diff - 1)
+					pending.remove(seq)
+			fci += bytes([(pid >> 8) & 0xFF, pid & 0xFF, (blp >> 8) & 0xFF, blp & 0xFF])
+
+		length = (HEADER_SIZE + len(fci)) // 4 - 1  # In 32-bit words minus one
+		header = bytearray(HEADER_SIZE)
+		header[0] = (2 << 6) | NACK_FMT
+		header[1] = RTCP_RTPFB
+		header[2] = (length >> 8) & 0xFF
+		header[3] = length & 0xFF
+		header[4:8] = senderSsrc.to_bytes(4, 'big')
+		header[8:12] = mediaSsrc.to_bytes(4, 'big')
+		self.packet = bytes(header + fci)
+
+	def decode(self, byteStream):
+		"""Decode a generic NACK. Returns False if the packet is not one."""
+		if len(byteStream) < HEADER_SIZE + 4:
+			return False
+		if byteStream[0] >> 6 != 2 or byteStream[0] & 0x1F != NACK_FMT or byteStream[1] != RTCP_RTPFB:
+			return False
+		length = ((byteStream[2] << 8 | byteStream[3]) + 1) * 4
+		self.senderSsrc = int.from_bytes(byteStream[4:8], 'big')
+		self.mediaSsrc = int.from_bytes(byteStream[8:12], 'big')
+		self.seqs = []
+		for i in range(HEADER_SIZE, min(length, len(byteStream)) - 3, 4):
+			pid = byteStream[i] << 8 | byteStream[i + 1]
+			blp = byteStream[i + 2] << 8 | byteStream[i + 3]
+			self.seqs.append(pid)
+			for bit in range(16):
+				if blp & (1 << bit):
+					self.seqs.append((pid + bit + 1) % 65536)
+		return True
+
+	def lostSeqs(self):
+		return self.seqs
+
+	def getPacket(self):
+		return self.packet
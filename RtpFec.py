@@ -0,0 +1,165 @@
+import math
+
+from RtpPacket import RtpPacket
+
+# XOR parity FEC in the spirit of RFC 5109.
+#
+# Media packets of a fragmented frame are laid out row by row in an L x D
+# matrix. Each row of L consecutive packets gets one row parity packet and,
+# when D > 0, each column of D packets (stride L) gets one column parity
+# packet, so single losses per row/column can be rebuilt and a 2D matrix can
+# repair bursts up to L packets long.
+#
+# Parity packets travel on the media port with their own payload type and
+# sequence space, carrying the frame's RTP timestamp. Parity payload:
+#   0-1  SN base           first media sequence number protected
+#   2    offset            stride between protected packets (1 = row, L = column)
+#   3    count             number of protected packets
+#   4-5  length recovery   XOR of protected payload lengths
+#   6    marker recovery   XOR of protected marker bits
+#   7    reserved
+#   8-   XOR of protected payloads, zero-padded to the longest one
+
+FEC_PT = 127
+FEC_HEADER_SIZE = 8
+
+class FecEncoder:
+	SSRC = 0x12345680  # Separate source for the parity stream
+
+	def __init__(self, rowSize, columnDepth=0):
+		self.rowSize = max(1, min(255, int(rowSize)))  # L
+		self.columnDepth = max(0, min(255, int(columnDepth)))  # D, 0 = row parity only
+		self.seqNum = 0
+		self.timestamp = 0
+		self.block = []
+
+	@staticmethod
+	def matrixForOverhead(percent, twoDimensional=False):
+		"""Pick (L, D) so that parity costs about `percent` % of the media packets."""
+		percent = max(1.0, float(percent))
+		if twoDimensional:
+			# Overhead = 1/L + 1/D with a square matrix
+			size = math.ceil(200.0 / percent)
+			return (size, size)
+		return (math.ceil(100.0 / percent), 0)
+
+	def overhead(self):
+		"""Parity packets per media packet for a full matrix."""
+		return 1.0 / self.rowSize + (1.0 / self.columnDepth if self.columnDepth else 0.0)
+
+	def startFrame(self, timestamp):
+		self.timestamp = timestamp
+		self.block = []
+
+	def add(self, seqnum, payload, marker):
+		"""Register a media packet. Returns parity packets that became ready."""
+		self.block.append((seqnum, payload, marker))
+		parity = []
+		if len(self.block) % self.rowSize == 0:
+			parity.append(self._makeParity(self.block[-self.rowSize:], 1))
+			if not self.columnDepth or len(self.block) == self.rowSize * self.columnDepth:
+				parity.extend(self._columnParity())
+				self.block = []
+		return parity
+
+	def finishFrame(self):
+		"""Flush parity for a partial last row/block of the frame."""
+		parity = []
+		tail = len(self.block) % self.rowSize
+		if tail:
+			parity.append(self._makeParity(self.block[-tail:], 1))
+		parity.extend(self._columnParity())
+		self.block = []
+		return parity
+
+	def _columnParity(self):
+		if not self.columnDepth or len(self.block) <= self.rowSize:
+			# A single row is already covered by its row parity
+			return []
+		return [self._makeParity(self.block[col::self.rowSize], self.rowSize)
+				for col in range(min(self.rowSize, len(self.block)))]
+
+	def _makeParity(self, packets, offset):
+		maxLen = 0
+		acc = 0
+		lengthRecovery = 0
+		markerRecovery = 0
+		for seqnum, payload, marker in packets:
+			# Little-endian ints make zero padding at the end implicit
+			acc ^= int.from_bytes(payload, 'little')
+			lengthRecovery ^= len(payload)
+			markerRecovery ^= marker
+			if len(payload) > maxLen:
+				maxLen = len(payload)
+
+		snBase = packets[0][0]
+		header = bytes([
+			(snBase >> 8) & 0xFF, snBase & 0xFF,
+			offset, len(packets),
+			(lengthRecovery >> 8) & 0xFF, lengthRecovery & 0xFF,
+			markerRecovery, 0
+		])
+
+		seqnum = self.seqNum
+		self.seqNum = (self.seqNum + 1) % 65536
+		rtpPacket = RtpPacket()
+		rtpPacket.encode(2, 0, 0, 0, seqnum, 0, FEC_PT, self.SSRC, header + acc.to_bytes(maxLen, 'little'), self.timestamp)
+		return rtpPacket.getPacket()
+
+class FecDecoder:
+	"""Client-side recovery of lost media packets from XOR parity."""
+
+	@staticmethod
+	def parseParity(payload):
+		"""Return (snBase, offset, count, lengthRecovery, markerRecovery, data) or None."""
+		if len(payload) < FEC_HEADER_SIZE:
+			return None
+		snBase = payload[0] << 8 | payload[1]
+		offset = payload[2]
+		count = payload[3]
+		if offset == 0 or count == 0:
+			return None
+		lengthRecovery = payload[4] << 8 | payload[5]
+		return (snBase, offset, count, lengthRecovery, payload[6] & 1, bytes(payload[FEC_HEADER_SIZE:]))
+
+	@staticmethod
+	def protectedSeqs(parity):
+		snBase, offset, count = parity[0], parity[1], parity[2]
+		return [(snBase + i * offset) % 65536 for i in range(count)]
+
+	@staticmethod
+	def recover(packets, parities):
+		"""Rebuild missing packets in place.
+
+		packets: dict seq -> (payload, marker); parities: list of parsed parity
+		records, consumed as they become useless. Rows and columns are retried
+		until no more progress is made, so 2D matrices repair iteratively.
+		Returns the number of packets recovered."""
+		recovered = 0
+		progress = True
+		while progress and parities:
+			progress = False
+			for parity in list(parities):
+				seqs = FecDecoder.protectedSeqs(parity)
+				missing = [s for s in seqs if s not in packets]
+				if len(missing) > 1:
+					continue
+				parities.remove(parity)
+				if not missing:
+					continue
+
+				acc = int.from_bytes(parity[5], 'little')
+				length = parity[3]
+				marker = parity[4]
+				for s in seqs:
+					if s != missing[0]:
+						payload, m = packets[s]
+						acc ^= int.from_bytes(payload, 'little')
+						length ^= len(payload)
+						marker ^= m
+				if length > len(parity[5]):
+					continue  # Corrupt parity, cannot trust it
+				packets[missing[0]] = (acc.to_bytes(len(parity[5]), 'little')[:length], marker)
+				recovered += 1
+				progress = True
+		return recovered
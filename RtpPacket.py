@@ -4,13 +4,16 @@ HEADER_SIZE = 12
 
 class RtpPacket:	
 	header = bytearray(HEADER_SIZE)
+	extensionProfile = 0
+	extensionData = None
 	
 	def __init__(self):
 		pass
 		
-	def encode(self, version, padding, extension, cc, seqnum, marker, pt, ssrc, payload, timestamp=None):
+	def encode(self, version, padding, extension, cc, seqnum, marker, pt, ssrc, payload, timestamp=None, extensionProfile=0, extensionData=None):
 		"""Encode the RTP packet with header fields and payload.
-		If timestamp is None, uses current time."""
+		If timestamp is None, uses current time.
+		If extension is 1, extensionData is sent as an RFC 3550 header extension."""
 		if timestamp is None:
 			timestamp = int(time() * 90000)  # RTP timestamp: 90kHz clock
 		header = bytearray(HEADER_SIZE)
@@ -29,13 +32,28 @@ class RtpPacket:
 		header[10] = (ssrc >> 8) & 0xFF
 		header[11] = ssrc & 0xFF
 
+		if extension and extensionData is not None:
+			# Extension header: profile-defined id + length in 32-bit words, data padded to a word
+			extensionData = bytes(extensionData) + bytes(-len(extensionData) % 4)
+			length = len(extensionData) // 4
+			header += bytes([(extensionProfile >> 8) & 0xFF, extensionProfile & 0xFF, (length >> 8) & 0xFF, length & 0xFF])
+			header += extensionData
+
 		self.header = header
 		self.payload = payload
 	
 	def decode(self, byteStream):
-		"""Decode the RTP packet."""
+		"""Decode the RTP packet, skipping CSRCs and the header extension."""
 		self.header = bytearray(byteStream[:HEADER_SIZE])
-		self.payload = byteStream[HEADER_SIZE:]
+		offset = HEADER_SIZE + 4 * (self.header[0] & 0x0F)
+		self.extensionProfile = 0
+		self.extensionData = None
+		if self.header[0] & 0x10 and len(byteStream) >= offset + 4:
+			self.extensionProfile = byteStream[offset] << 8 | byteStream[offset + 1]
+			length = (byteStream[offset + 2] << 8 | byteStream[offset + 3]) * 4
+			self.extensionData = byteStream[offset + 4 : offset + 4 + length]
+			offset += 4 + length
+		self.payload = byteStream[offset:]
 	
 	def version(self):
 		return int(self.header[0] >> 6)
@@ -48,10 +66,20 @@ class RtpPacket:
 		timestamp = self.header[4] << 24 | self.header[5] << 16 | self.header[6] << 8 | self.header[7]
 		return int(timestamp)
 	
+	def ssrc(self):
+		ssrc = self.header[8] << 24 | self.header[9] << 16 | self.header[10] << 8 | self.header[11]
+		return int(ssrc)
+	
 	def payloadType(self):
 		pt = self.header[1] & 127
 		return int(pt)
 	
+	def getExtension(self):
+		"""Return (profile, data) of the header extension, or None."""
+		if self.extensionData is None:
+			return None
+		return (self.extensionProfile, self.extensionData)
+	
 	def getPayload(self):
 		return self.payload
 		
@@ -0,0 +1,147 @@
+import time
+
+from RtpPacket import RtpPacket
+from RtpFec import FEC_HEADER_SIZE
+from LatencyTracer import TRACE_EXT_PROFILE, TRACE_EXT_SIZE, makeTraceExtension, nowUs
+
+class RtpPacketizer:
+	"""Send path shared by ServerWorker (one session) and BroadcastChannel
+	(one stream for many viewers).
+
+	Owns the sequence space of one RTP source and fragments frames into
+	MTU-sized packets. Optional hooks: an FecEncoder for parity, a
+	PacketHistory for retransmission and a LatencyTracer for the trace
+	header extension. Counters go into the caller's stats dict."""
+
+	# MTU settings: Ethernet MTU = 1500, minus IP header (20) and UDP header (8) = 1472
+	MTU_SIZE = 1500
+	IP_UDP_HEADER_SIZE = 28  # IP (20) + UDP (8)
+	MAX_RTP_PAYLOAD = MTU_SIZE - IP_UDP_HEADER_SIZE - 12  # RTP header = 12 bytes
+
+	PAYLOAD_TYPE = 26  # MJPEG
+	BATCH_SIZE = 50  # Send in batches to avoid overwhelming the socket
+
+	def __init__(self, ssrc, stats, fecEncoder=None, history=None, tracer=None):
+		self.ssrc = ssrc
+		self.stats = stats
+		self.fecEncoder = fecEncoder
+		self.history = history
+		self.tracer = tracer
+		self.seqNum = 0  # Sequence number for all media packets of this source
+		self.frameTimestamp = 0  # RTP timestamp (90kHz clock)
+		self.packetizeUs = 0  # Time spent in makeRtp for the current frame (tracing only)
+		# Leave room for the trace header extension so packets still fit the MTU,
+		# and for the FEC header since parity is as long as the longest fragment
+		self.maxPayload = self.MAX_RTP_PAYLOAD - (TRACE_EXT_SIZE if tracer else 0) - (FEC_HEADER_SIZE if fecEncoder else 0)
+		for key in ('total_packets_sent', 'total_bytes_sent', 'total_frames_sent', 'fragmented_frames', 'fec_packets_sent'):
+			stats.setdefault(key, 0)
+
+	def packetize(self, data, frameNbr):
+		"""Yield the RTP packets of one frame; marker set on the last fragment.
+		Fragmented frames get FEC parity right behind the group it protects."""
+		data_len = len(data)
+		fec = self.fecEncoder if data_len > self.maxPayload else None
+		if fec:
+			fec.startFrame(self.frameTimestamp)
+		if data_len > self.maxPayload:
+			self.stats['fragmented_frames'] += 1
+
+		start = 0
+		while start < data_len:
+			end = min(start + self.maxPayload, data_len)
+			marker = 1 if end >= data_len else 0
+			payload = data[start:end]
+			seqnum = self.seqNum
+			if self.history:
+				# Reference into the frame, not a copy of the fragment
+				self.history.add(seqnum, data, start, end, marker, self.frameTimestamp)
+			yield self.makeRtp(payload, frameNbr, marker)
+
+			if fec:
+				parity = fec.add(seqnum, payload, marker)
+				if marker:
+					parity.extend(fec.finishFrame())
+				self.stats['fec_packets_sent'] += len(parity)
+				yield from parity
+			start = end
+
+	def sendFrame(self, rtpSocket, data, frameNbr, targets):
+		"""Packetize a frame once and send every packet to each target. Returns packets sent."""
+		self.packetizeUs = 0
+		packets_sent = 0
+		batch = []
+		for packet in self.packetize(data, frameNbr):
+			batch.append(packet)
+			if len(batch) >= self.BATCH_SIZE:
+				packets_sent += self._sendBatch(rtpSocket, batch, targets)
+				batch.clear()
+		if batch:
+			packets_sent += self._sendBatch(rtpSocket, batch, targets)
+		self.stats['total_frames_sent'] += 1
+		return packets_sent
+
+	def _sendBatch(self, rtpSocket, batch, targets):
+		sent = 0
+		for packet in batch:
+			for target in targets:
+				if self.send(rtpSocket, packet, target):
+					sent += 1
+		return sent
+
+	def send(self, rtpSocket, packet, target):
+		"""Send one packet, retrying once if the socket buffer is full."""
+		try:
+			rtpSocket.sendto(packet, target)
+		except BlockingIOError:
+			# Socket buffer full, wait a tiny bit
+			time.sleep(0.00001)  # 10 microseconds
+			try:
+				rtpSocket.sendto(packet, target)
+			except:
+				return False  # Skip if still can't send
+		except:
+			return False  # Skip on error
+		self.stats['total_packets_sent'] += 1
+		self.stats['total_bytes_sent'] += len(packet)
+		return True
+
+	def makeRtp(self, payload, frameNbr, marker):
+		"""Create RTP packet with proper sequence numbering for fragmentation."""
+		seqnum = self.seqNum
+		# Increment sequence number for next packet
+		self.seqNum = (self.seqNum + 1) % 65536
+
+		rtpPacket = RtpPacket()
+		if self.tracer:
+			# Carry send time + frame id so the client can split out network delay
+			started = nowUs()
+			rtpPacket.encode(2, 0, 1, 0, seqnum, marker, self.PAYLOAD_TYPE, self.ssrc, payload, self.frameTimestamp, TRACE_EXT_PROFILE, makeTraceExtension(frameNbr))
+			packet = rtpPacket.getPacket()
+			self.packetizeUs += nowUs() - started
+			return packet
+		rtpPacket.encode(2, 0, 0, 0, seqnum, marker, self.PAYLOAD_TYPE, self.ssrc, payload, self.frameTimestamp)
+		return rtpPacket.getPacket()
+
+	def printStatistics(self, title, extraLines=()):
+		"""Print network usage and performance statistics."""
+		elapsed = time.time() - self.stats['start_time']
+		if elapsed > 0:
+			avg_bandwidth_mbps = (self.stats['total_bytes_sent'] * 8) / (elapsed * 1000000)
+			packets_per_sec = self.stats['total_packets_sent'] / elapsed
+			frames_per_sec = self.stats['total_frames_sent'] / elapsed
+
+			print(f"\n=== {title} ===")
+			print(f"Total Frames Sent: {self.stats['total_frames_sent']}")
+			print(f"Fragmented Frames: {self.stats['fragmented_frames']}")
+			if self.fecEncoder:
+				print(f"FEC Packets: {self.stats['fec_packets_sent']}")
+			for line in extraLines:
+				print(line)
+			print(f"Total Packets: {self.stats['total_packets_sent']}")
+			print(f"Total Bytes: {self.stats['total_bytes_sent'] / (1024*1024):.2f} MB")
+			print(f"Average Bandwidth: {avg_bandwidth_mbps:.2f} Mbps")
+			print(f"Packets/sec: {packets_per_sec:.1f}")
+			print(f"Frames/sec: {frames_per_sec:.1f}")
+			print(f"=======================\n")
+			if self.tracer:
+				print(self.tracer.summary())
@@ -1,6 +1,8 @@
 import sys, socket
 
 from ServerWorker import ServerWorker
+from BroadcastChannel import BroadcastChannel
+from RtpFec import FecEncoder
 
 class Server:	
 	
@@ -8,7 +10,53 @@ class Server:
 		try:
 			SERVER_PORT = int(sys.argv[1])
 		except:
-			print("[Usage: Server.py Server_port]\n")
+			print("[Usage: Server.py Server_port [--broadcast] [--multicast group:port] [--fec percent [--fec-2d]] [--fec-matrix LxD] [--nack] [--trace] [--trace-file prefix]]\n")
+		
+		# Optional live-channel mode: one shared producer per file
+		if '--broadcast' in sys.argv:
+			ServerWorker.BROADCAST = True
+		if '--multicast' in sys.argv:
+			try:
+				group, port = sys.argv[sys.argv.index('--multicast') + 1].split(':')
+				BroadcastChannel.MULTICAST_ADDR = (group, int(port))
+				ServerWorker.BROADCAST = True
+			except (IndexError, ValueError):
+				print("[Usage: --multicast group:port]\n")
+		
+		# Optional XOR parity FEC: by overhead percentage (row parity, or row + column
+		# parity with --fec-2d) or explicit L x D matrix
+		fecMatrix = None
+		try:
+			if '--fec' in sys.argv:
+				fecMatrix = FecEncoder.matrixForOverhead(float(sys.argv[sys.argv.index('--fec') + 1]), '--fec-2d' in sys.argv)
+			if '--fec-matrix' in sys.argv:
+				rows, depth = sys.argv[sys.argv.index('--fec-matrix') + 1].lower().split('x')
+				fecMatrix = (int(rows), int(depth))
+		except (IndexError, ValueError):
+			print("[Usage: --fec percent [--fec-2d] | --fec-matrix LxD]\n")
+		if fecMatrix:
+			ServerWorker.FEC_MATRIX = fecMatrix
+			BroadcastChannel.FEC_MATRIX = fecMatrix
+			print(f"FEC enabled: L={fecMatrix[0]} D={fecMatrix[1]} (~{FecEncoder(*fecMatrix).overhead() * 100:.1f}% overhead)")
+		
+		# Optional NACK-driven retransmission of lost packets
+		if '--nack' in sys.argv:
+			ServerWorker.RETRANSMIT = True
+			BroadcastChannel.RETRANSMIT = True
+		
+		# Optional per-stage latency tracing (histograms, plus per-frame CSV with --trace-file)
+		if '--trace' in sys.argv:
+			ServerWorker.TRACE = True
+			BroadcastChannel.TRACE = True
+		if '--trace-file' in sys.argv:
+			try:
+				ServerWorker.TRACE_FILE = sys.argv[sys.argv.index('--trace-file') + 1]
+				ServerWorker.TRACE = True
+				BroadcastChannel.TRACE_FILE = ServerWorker.TRACE_FILE
+				BroadcastChannel.TRACE = True
+			except IndexError:
+				print("[Usage: --trace-file prefix]\n")
+		
 		rtspSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 		rtspSocket.bind(('', SERVER_PORT))
 		rtspSocket.listen(5)        
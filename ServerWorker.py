@@ -1,9 +1,15 @@
 from random import randint
-import sys, traceback, threading, socket, time
+import sys, traceback, threading, socket, time, select
 from collections import deque
 
 from VideoStream import VideoStream
-from RtpPacket import RtpPacket
+from LiveVideoStream import LiveVideoStream, LIVE_PREFIX
+from RtpPacketizer import RtpPacketizer
+from BroadcastChannel import BroadcastChannel
+from RtpFec import FecEncoder
+from RtcpNack import RtcpNack
+from PacketHistory import PacketHistory, RateLimiter
+from LatencyTracer import LatencyTracer, nowUs
 
 class ServerWorker:
 	SETUP = 'SETUP'
@@ -20,11 +26,23 @@ class ServerWorker:
 	FILE_NOT_FOUND_404 = 1
 	CON_ERR_500 = 2
 	
-	# MTU settings: Ethernet MTU = 1500, minus IP header (20) and UDP header (8) = 1472
-	# Use 1400 for safety margin
-	MTU_SIZE = 1500
-	IP_UDP_HEADER_SIZE = 28  # IP (20) + UDP (8)
-	MAX_RTP_PAYLOAD = MTU_SIZE - IP_UDP_HEADER_SIZE - 12  # RTP header = 12 bytes
+	# Broadcast mode: sessions playing the same file share one BroadcastChannel
+	BROADCAST = False
+	
+	# Forward error correction for fragmented frames: (L, D) parity matrix or None
+	FEC_MATRIX = None
+	
+	# NACK-based selective retransmission from a per-session packet history
+	RETRANSMIT = False
+	RETRANSMIT_RATE = 1000  # Max retransmitted packets per second per session
+	RETRANSMIT_BURST = 200
+	
+	SSRC = 0x12345678  # Synchronization source identifier
+	
+	# Per-stage latency tracing; TRACE_FILE is a path prefix for per-session CSV traces
+	TRACE = False
+	TRACE_FILE = None
+	TRACE_COLUMNS = ('frame', 'send_start_us', 'read_us', 'packetize_us', 'send_us', 'pacing_lag_us', 'packets')
 	
 	clientInfo = {}
 	
@@ -33,16 +51,21 @@ class ServerWorker:
 		'total_packets_sent': 0,
 		'total_bytes_sent': 0,
 		'total_frames_sent': 0,
-		'fragmented_frames': 0,
+		'nacks_received': 0,
+		'retransmitted_packets': 0,
+		'retransmits_dropped': 0,
 		'start_time': None,
 		'last_stats_time': None
 	}
 	
 	def __init__(self, clientInfo):
 		self.clientInfo = clientInfo
-		self.seqNum = 0  # Global sequence number for all packets
-		self.frameTimestamp = 0  # RTP timestamp (90kHz clock)
 		self.adaptiveQuality = 1.0  # Adaptive quality factor (0.0-1.0)
+		self.fecEncoder = FecEncoder(*self.FEC_MATRIX) if self.FEC_MATRIX else None
+		self.history = PacketHistory(self.SSRC) if self.RETRANSMIT else None
+		self.retransmitLimiter = RateLimiter(self.RETRANSMIT_RATE, self.RETRANSMIT_BURST)
+		self.tracer = LatencyTracer('server') if self.TRACE else None
+		self.packetizer = RtpPacketizer(self.SSRC, self.stats, self.fecEncoder, self.history, self.tracer)
 		self.stats['start_time'] = time.time()
 		self.stats['last_stats_time'] = time.time()
 		
@@ -72,12 +95,23 @@ class ServerWorker:
 			if self.state == self.INIT:
 				print("processing SETUP\n")
 				try:
-					self.clientInfo['videoStream'] = VideoStream(filename)
+					if self.BROADCAST:
+						# Join (or start) the shared channel instead of loading the file again
+						self.clientInfo['channel'] = BroadcastChannel.getChannel(filename)
+						self.clientInfo['videoStream'] = self.clientInfo['channel'].videoStream
+						self.tracer = None  # The channel traces the sending
+					elif filename.startswith(LIVE_PREFIX):
+						# Live ingest: join the shared reader at the live edge
+						self.clientInfo['videoStream'] = LiveVideoStream(filename[len(LIVE_PREFIX):])
+					else:
+						self.clientInfo['videoStream'] = VideoStream(filename)
 					self.state = self.READY
 				except IOError:
 					self.replyRtsp(self.FILE_NOT_FOUND_404, seq[1])
 				
 				self.clientInfo['session'] = randint(100000, 999999)
+				if self.tracer and self.TRACE_FILE:
+					self.tracer.openTrace(f"{self.TRACE_FILE}-server-{self.clientInfo['session']}.csv", self.TRACE_COLUMNS)
 				self.replyRtsp(self.OK_200, seq[1])
 				try:
 					self.clientInfo['rtpPort'] = request[2].split(' ')[3]
@@ -88,6 +122,16 @@ class ServerWorker:
 			if self.state == self.READY:
 				print("processing PLAY\n")
 				self.state = self.PLAYING
+				if 'channel' in self.clientInfo:
+					try:
+						self._subscribeChannel(filename)
+					except IOError:
+						# The channel had ended and its file is gone now
+						self.state = self.READY
+						self.replyRtsp(self.FILE_NOT_FOUND_404, seq[1])
+						return
+					self.replyRtsp(self.OK_200, seq[1])
+					return
 				if "rtpSocket" not in self.clientInfo:
 					self.clientInfo["rtpSocket"] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 					try:
@@ -106,6 +150,9 @@ class ServerWorker:
 								self.clientInfo["rtpSocket"].setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 2*1024*1024)
 							except:
 								pass
+					if self.history:
+						# NACKs come back to the RTP socket the client sees packets from
+						threading.Thread(target=self.recvRtcp, args=(self.clientInfo["rtpSocket"],), daemon=True).start()
 
 				self.replyRtsp(self.OK_200, seq[1])
 				self.clientInfo['event'] = threading.Event()
@@ -116,16 +163,42 @@ class ServerWorker:
 			if self.state == self.PLAYING:
 				print("processing PAUSE\n")
 				self.state = self.READY
-				self.clientInfo['event'].set()
+				if 'channel' in self.clientInfo:
+					self.clientInfo['channel'].unsubscribe(self.clientInfo['session'])
+				else:
+					self.clientInfo['event'].set()
 				self.replyRtsp(self.OK_200, seq[1])
 		
 		elif requestType == self.TEARDOWN:
 			print("processing TEARDOWN\n")
-			self.clientInfo['event'].set()
+			if 'channel' in self.clientInfo:
+				self.clientInfo['channel'].unsubscribe(self.clientInfo['session'])
+			if 'event' in self.clientInfo:
+				self.clientInfo['event'].set()
 			self.replyRtsp(self.OK_200, seq[1])
 			if "rtpSocket" in self.clientInfo:
 				self.clientInfo['rtpSocket'].close()
 				del self.clientInfo['rtpSocket']
+			if self.tracer:
+				print(self.tracer.summary())
+				self.tracer.close()
+			
+	def _subscribeChannel(self, filename):
+		"""Attach this session's RTP receive address to the shared channel."""
+		if not self.clientInfo['channel'].subscribe(self.clientInfo['session'], self._channelAddress()):
+			# Channel reached end of stream: start a fresh one for this file
+			self.clientInfo['channel'] = BroadcastChannel.getChannel(filename)
+			self.clientInfo['videoStream'] = self.clientInfo['channel'].videoStream
+			self.clientInfo['channel'].subscribe(self.clientInfo['session'], self._channelAddress())
+
+	def _channelAddress(self):
+		"""Where the client receives channel packets (and sends NACKs from):
+		its SETUP client_port, or the group port when the channel is multicast."""
+		host = self.clientInfo['rtspSocket'][1][0]
+		multicastAddr = self.clientInfo['channel'].multicastAddr
+		if multicastAddr:
+			return (host, multicastAddr[1])
+		return (host, int(self.clientInfo['rtpPort']))
 			
 	def sendRtp(self):
 		"""Send RTP packets over UDP with efficient MTU-aware fragmentation and adaptive control."""
@@ -133,8 +206,8 @@ class ServerWorker:
 		BASE_FRAME_INTERVAL = 1.0 / 30.0  # 30 FPS (0.0333s per frame)
 		next_frame_time = time.time()
 		
-		# Pre-allocate RTP packet object to reduce allocation overhead
-		rtpPacket = RtpPacket()
+		packetizer = self.packetizer
+		tracer = self.tracer
 		
 		while True:
 			# Calculate time until next frame should be sent
@@ -148,34 +221,38 @@ class ServerWorker:
 			if self.clientInfo['event'].isSet(): 
 				break 
 			
+			scheduled_time = next_frame_time
 			# Update next frame time (maintain consistent frame rate)
 			next_frame_time = max(current_time, next_frame_time) + BASE_FRAME_INTERVAL
 			
 			frame_start_time = time.time()
+			if tracer:
+				read_start = nowUs()
 			data = self.clientInfo['videoStream'].nextFrame()
 			
 			if data: 
+				if tracer:
+					send_start = nowUs()
 				frameNumber = self.clientInfo['videoStream'].frameNbr()
 				try:
 					address = self.clientInfo['rtspSocket'][1][0]
 					port = int(self.clientInfo['rtpPort'])
 					
 					# Update RTP timestamp (90kHz clock)
-					self.frameTimestamp = int(frame_start_time * 90000)
+					packetizer.frameTimestamp = int(frame_start_time * 90000)
 					
-					# Fragment frame if it exceeds MTU
-					if len(data) > self.MAX_RTP_PAYLOAD:
-						packets_sent = self._sendFragmentedFrame(data, frameNumber, address, port)
-						self.stats['fragmented_frames'] += 1
-					else:
-						# Single packet frame
-						packet = self.makeRtp(data, frameNumber, 1)
-						self.clientInfo['rtpSocket'].sendto(packet, (address, port))
-						packets_sent = 1
-						self.stats['total_bytes_sent'] += len(packet)
+					# Fragments the frame if it exceeds the MTU
+					packets_sent = packetizer.sendFrame(self.clientInfo['rtpSocket'], data, frameNumber, [(address, port)])
 					
-					self.stats['total_packets_sent'] += packets_sent
-					self.stats['total_frames_sent'] += 1
+					if tracer:
+						send_us = nowUs() - send_start - packetizer.packetizeUs
+						read_us = send_start - read_start
+						lag_us = int((frame_start_time - scheduled_time) * 1000000)
+						tracer.record('read', read_us)
+						tracer.record('packetize', packetizer.packetizeUs)
+						tracer.record('send', send_us)
+						tracer.record('pacing_lag', lag_us)
+						tracer.trace(frameNumber, send_start, read_us, packetizer.packetizeUs, send_us, lag_us, packets_sent)
 					
 					# Print statistics every 5 seconds
 					if current_time - self.stats['last_stats_time'] >= 5.0:
@@ -187,92 +264,53 @@ class ServerWorker:
 					# On error, skip this frame and continue
 					continue
 	
-	def _sendFragmentedFrame(self, data, frameNumber, address, port):
-		"""Efficiently fragment and send a frame that exceeds MTU - optimized for 4K large frames."""
-		packets_sent = 0
-		start = 0
-		rtp_socket = self.clientInfo['rtpSocket']
-		address_port = (address, port)
-		data_len = len(data)
-		
-		# For very large 4K frames (2-5MB), batch send for better performance
-		# 4K frames can be 1500+ packets, so batching reduces overhead
-		batch_size = 50  # Send in batches to avoid overwhelming the socket
-		packet_batch = []
-		
-		while start < data_len:
-			end = min(start + self.MAX_RTP_PAYLOAD, data_len)
-			payload_chunk = data[start:end]
-			
-			# Marker bit: 1 for last fragment of frame, 0 otherwise
-			marker = 1 if end >= data_len else 0
-			
-			# Create RTP packet
-			packet = self.makeRtp(payload_chunk, frameNumber, marker)
-			packet_batch.append((packet, len(packet)))
-			
-			# Send batch when it reaches batch_size or at end of frame
-			if len(packet_batch) >= batch_size or marker:
-				for pkt, pkt_len in packet_batch:
-					try:
-						rtp_socket.sendto(pkt, address_port)
-						self.stats['total_bytes_sent'] += pkt_len
-						packets_sent += 1
-					except BlockingIOError:
-						# Socket buffer full, wait a tiny bit
-						time.sleep(0.00001)  # 10 microseconds
-						try:
-							rtp_socket.sendto(pkt, address_port)
-							self.stats['total_bytes_sent'] += pkt_len
-							packets_sent += 1
-						except:
-							pass  # Skip if still can't send
-					except:
-						pass  # Skip on error
-				packet_batch.clear()
+	def recvRtcp(self, rtpSocket):
+		"""Serve generic NACKs from the client by retransmitting from the packet history.
+		Only NACKs from the session's own RTP address are honoured, and repairs
+		always go to that address, so the server cannot be used as a reflector."""
+		clientAddress = (self.clientInfo['rtspSocket'][1][0], int(self.clientInfo['rtpPort']))
+		while True:
+			try:
+				readable, _, _ = select.select([rtpSocket], [], [], 0.5)
+				if not readable:
+					continue
+				data, address = rtpSocket.recvfrom(2048)
+			except BlockingIOError:
+				continue
+			except (OSError, ValueError):
+				break  # Socket closed on TEARDOWN
 			
-			start = end
-		
-		return packets_sent
+			if address != clientAddress:
+				continue  # Not from this session's client
+			nack = RtcpNack()
+			if not nack.decode(data):
+				continue
+			self.stats['nacks_received'] += 1
+			now = time.time()
+			for seqnum in nack.lostSeqs():
+				packet = self.history.get(seqnum, now)
+				if packet is None or not self.retransmitLimiter.allow(now):
+					# Evicted, past its playout deadline, or over the retransmit budget
+					self.stats['retransmits_dropped'] += 1
+					continue
+				if self.packetizer.send(rtpSocket, packet, clientAddress):
+					self.stats['retransmitted_packets'] += 1
 	
 	def _printStatistics(self):
 		"""Print network usage and performance statistics."""
-		elapsed = time.time() - self.stats['start_time']
-		if elapsed > 0:
-			avg_bandwidth_mbps = (self.stats['total_bytes_sent'] * 8) / (elapsed * 1000000)
-			packets_per_sec = self.stats['total_packets_sent'] / elapsed
-			frames_per_sec = self.stats['total_frames_sent'] / elapsed
-			
-			print(f"\n=== Server Statistics ===")
-			print(f"Total Frames Sent: {self.stats['total_frames_sent']}")
-			print(f"Fragmented Frames: {self.stats['fragmented_frames']}")
-			print(f"Total Packets: {self.stats['total_packets_sent']}")
-			print(f"Total Bytes: {self.stats['total_bytes_sent'] / (1024*1024):.2f} MB")
-			print(f"Average Bandwidth: {avg_bandwidth_mbps:.2f} Mbps")
-			print(f"Packets/sec: {packets_per_sec:.1f}")
-			print(f"Frames/sec: {frames_per_sec:.1f}")
-			print(f"=======================\n")
-
-	def makeRtp(self, payload, frameNbr, marker):
-		"""Create RTP packet with proper sequence numbering for fragmentation."""
-		version = 2
-		padding = 0
-		extension = 0
-		cc = 0
-		pt = 26  # MJPEG payload type
-		seqnum = self.seqNum
-		ssrc = 0x12345678  # Synchronization source identifier
-		
-		# Increment sequence number for next packet
-		self.seqNum = (self.seqNum + 1) % 65536
-		
-		rtpPacket = RtpPacket()
-		rtpPacket.encode(version, padding, extension, cc, seqnum, marker, pt, ssrc, payload, self.frameTimestamp)
-		return rtpPacket.getPacket()
+		extraLines = []
+		if self.history:
+			extraLines.append(f"NACKs Received: {self.stats['nacks_received']}")
+			extraLines.append(f"Retransmitted Packets: {self.stats['retransmitted_packets']} (dropped: {self.stats['retransmits_dropped']})")
+		self.packetizer.printStatistics("Server Statistics", extraLines)
 		
 	def replyRtsp(self, code, seq):
 		if code == self.OK_200:
 			reply = 'RTSP/1.0 200 OK\nCSeq: ' + seq + '\nSession: ' + str(self.clientInfo['session'])
+			channel = self.clientInfo.get('channel')
+			if channel is not None and channel.multicastAddr:
+				# Tell the client which group to join for multicast delivery
+				reply += '\nTransport: RTP/UDP;multicast;destination=' + channel.multicastAddr[0] + ';port=' + str(channel.multicastAddr[1])
 			connSocket = self.clientInfo['rtspSocket'][0]
 			connSocket.send(reply.encode())
 		elif code == self.FILE_NOT_FOUND_404:
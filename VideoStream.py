@@ -1,52 +1,41 @@
+import mmap, os
+
+from JpegIndexer import indexFrames
+
 class VideoStream:
 	def __init__(self, filename):
 		self.filename = filename
 		self.frameNum = 0
-		self.frames = [] # Danh sách chứa tất cả các frame đã được tách
-		
+
 		try:
 			with open(filename, 'rb') as f:
-				data = f.read() # Đọc toàn bộ file vào bộ nhớ
-		except:
+				# Ánh xạ file vào bộ nhớ (mmap) thay vì đọc toàn bộ file
+				size = os.fstat(f.fileno()).st_size
+				self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+		except (OSError, ValueError):
 			raise IOError
-			
-		# Dấu hiệu nhận biết
-		SOI = b'\xff\xd8' # Start of Image
-		EOI = b'\xff\xd9' # End of Image
-		
-		start = 0
-		while True:
-			# 1. Tìm vị trí bắt đầu của ảnh (FF D8)
-			start_index = data.find(SOI, start)
-			if start_index == -1:
-				break # Không còn ảnh nào nữa
-			
-			# 2. Tìm vị trí kết thúc của ảnh (FF D9)
-			# Tìm EOI bắt đầu từ sau vị trí SOI
-			end_index = data.find(EOI, start_index)
-			if end_index == -1:
-				break # File bị cắt cụt, dừng lại
-				
-			# 3. Trích xuất frame
-			# Slice từ start_index đến end_index + 2 (để lấy cả 2 byte FF D9)
-			frame = data[start_index : end_index + 2]
-			self.frames.append(frame)
-			
-			# 4. Cập nhật vị trí tìm kiếm cho vòng lặp sau
-			# Bắt đầu tìm từ sau frame vừa lấy được
-			start = end_index + 2
-			
-		print(f"VideoStream: Loaded {len(self.frames)} frames from {filename}")
+
+		# Chỉ mục gọn: vị trí bắt đầu và độ dài của từng frame trong file.
+		# Duyệt theo các segment JPEG (dùng trường độ dài) nên FF D9 nằm trong
+		# ảnh thumbnail EXIF không làm cắt sai frame; file lớn được quét song song.
+		self.offsets, self.lengths = indexFrames(self.data, filename)
+
+		print(f"VideoStream: Loaded {len(self.offsets)} frames from {filename}")
 
 	def nextFrame(self):
 		"""Get next frame."""
-		# Chỉ đơn giản là lấy frame từ danh sách đã tách sẵn
-		if self.frameNum < len(self.frames):
-			frame = self.frames[self.frameNum]
+		# Cắt frame từ file theo chỉ mục đã tạo sẵn
+		if self.frameNum < len(self.offsets):
+			offset = self.offsets[self.frameNum]
+			frame = self.data[offset : offset + self.lengths[self.frameNum]]
 			self.frameNum += 1
 			return frame
 		return None
-		
+
 	def frameNbr(self):
 		"""Get frame number."""
-		return self.frameNum
\ No newline at end of file
+		return self.frameNum
+
+	def isEnded(self):
+		"""Đã phát hết tất cả các frame."""
+		return self.frameNum >= len(self.offsets)